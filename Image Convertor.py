@@ -1,13 +1,28 @@
 import argparse
+import collections
+import contextlib
+import csv
+import io
+import json
+import mmap
 import sys
 import os
+import tarfile
 import threading
-from pathlib import Path
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+import numpy as np
 import customtkinter as ctk
-from PIL import Image, ImageOps
+from PIL import Image, ImageCms, ImageFile, ImageOps
 from tkinter import filedialog, messagebox
 from pillow_heif import register_heif_opener
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
@@ -71,11 +86,671 @@ class ReadOnlyTextbox(ctk.CTkTextbox):
         self.see("insert")
         return "break"
 
+
+WEBP_MAX_SIDE = 16383
+
+
+def classify_image(img, sample_side=256):
+    """Pick an output format for AUTO mode from a downsampled view of the image.
+
+    Returns a (format, lossless, reason) tuple. Only a small nearest-neighbour
+    thumbnail is analysed, so the cost stays at a few milliseconds per image.
+    """
+    w, h = img.size
+    scale = min(1.0, sample_side / max(w, h))
+    thumb = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.NEAREST)
+    if thumb.mode.startswith("I"):
+        # convert() clips 16/32-bit values at 255; scale 16-bit data down instead.
+        values = np.asarray(thumb, dtype=np.uint32)
+        if thumb.mode != "I" or values.max() > 255:
+            values = values >> 8
+        thumb = Image.fromarray(values.astype(np.uint8), "L")
+    rgba = np.asarray(thumb.convert("RGBA"))
+
+    has_alpha = bool((rgba[..., 3] < 255).any())
+    rgb = rgba[..., :3].astype(np.int32)
+    packed = np.sort((rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2], axis=None)
+    colors = 1 + int(np.count_nonzero(packed[1:] != packed[:-1]))
+    # A grey image never has more than 256 levels, so only a much smaller count marks it as a graphic.
+    grayscale = bool((rgba[..., 0] == rgba[..., 1]).all() and (rgba[..., 1] == rgba[..., 2]).all())
+    max_colors = 64 if grayscale else 256
+
+    luma = (rgb[..., 0] + rgb[..., 1] + rgb[..., 2]) // 3
+    grad = np.concatenate((np.abs(np.diff(luma, axis=0)).ravel(), np.abs(np.diff(luma, axis=1)).ravel()))
+    flat_ratio = float((grad == 0).mean()) if grad.size else 1.0
+    edge_density = float((grad > 32).mean()) if grad.size else 0.0
+
+    graphic = colors <= max_colors or (flat_ratio >= 0.6 and edge_density >= 0.02)
+    kind = "graphic" if graphic else "photo"
+    reason = (
+        f"{kind}, {colors} {'grey levels' if grayscale else 'colors'}, "
+        f"edges {edge_density:.1%}, alpha {'yes' if has_alpha else 'no'}"
+    )
+
+    if max(w, h) > WEBP_MAX_SIDE:
+        if graphic or has_alpha:
+            return "png", True, reason
+        return "jpg", False, reason
+    return "webp", graphic, reason
+
+
+class ColorStage:
+    """Converts images to sRGB and flattens alpha for JPG output.
+
+    ICC transforms are cached per (profile, mode) pair, so each distinct source
+    profile is only parsed and built once per run. For JPG output, RGBA files are
+    decoded straight into a per-worker NumPy buffer that is reused from image to
+    image, composited onto white in place, and handed to the JPEG encoder as RGBX,
+    so no second full-size image is allocated. Buffers above KEEP_BUFFER_BYTES are
+    used for one image only, so a single huge file does not pin memory in every worker.
+    """
+
+    STRIP_BYTES = 4 * 1024 * 1024
+    BLEND_STRIP_PIXELS = 16384
+    KEEP_BUFFER_BYTES = 64 * 1024 * 1024
+
+    def __init__(self):
+        self._srgb = ImageCms.createProfile("sRGB")
+        self._transforms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_transform(self, icc, in_mode, out_mode):
+        key = (icc, in_mode, out_mode)
+        with self._lock:
+            if key in self._transforms:
+                return self._transforms[key]
+        try:
+            profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+            if in_mode != "CMYK" and "srgb" in ImageCms.getProfileDescription(profile).lower():
+                transform = None
+            else:
+                transform = ImageCms.buildTransform(profile, self._srgb, in_mode, out_mode)
+        except (ImageCms.PyCMSError, OSError):
+            transform = None
+        with self._lock:
+            self._transforms[key] = transform
+        return transform
+
+    def _buffer(self, w, h):
+        """Return this worker's reusable RGBA buffer, grown to at least w x h."""
+        needed = w * h * 4
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.size < needed:
+            buffer = np.empty(needed, dtype=np.uint8)
+            if needed <= self.KEEP_BUFFER_BYTES:
+                self._local.buffer = buffer
+        return buffer[:needed].reshape(h, w, 4)
+
+    def _decode_into_buffer(self, img):
+        """Have Pillow decode an RGBA file straight into the worker buffer.
+
+        Returns the buffer, or None when the plugin allocated its own image memory.
+        """
+        pixels = self._buffer(*img.size)
+        core = Image.frombuffer("RGBA", img.size, pixels, "raw", "RGBA", 0, 1).im
+        img.im = core
+        img.load()
+        return pixels if img.im is core else None
+
+    def _flatten(self, img, pixels=None):
+        """Composite onto white and return an RGBX view of the worker buffer."""
+        w, h = img.size
+        if pixels is not None:
+            # The pixels were decoded into the buffer: blend in place, a few rows at a
+            # time so the uint16 scratch space stays in cache.
+            # white * (1 - a) + c * a  ==  255 - (255 - c) * a / 255
+            rows = max(1, self.BLEND_STRIP_PIXELS // w)
+            scratch = np.empty((rows, w, 4), dtype=np.uint16)
+            for y0 in range(0, h, rows):
+                strip = pixels[y0:y0 + rows]
+                tmp = scratch[:len(strip)]
+                np.subtract(255, strip, out=tmp, dtype=np.uint16)
+                tmp *= strip[..., 3:]
+                tmp += 128
+                tmp += tmp >> 8
+                tmp >>= 8
+                np.subtract(255, tmp, out=strip, casting="unsafe")
+        else:
+            # Already decoded elsewhere: let Pillow blend it into a white-filled buffer.
+            pixels = self._buffer(w, h)
+            pixels.fill(255)
+            target = Image.frombuffer("RGBA", (w, h), pixels, "raw", "RGBA", 0, 1)
+            target.readonly = 0
+            if img.mode == "RGBA":
+                target.paste(img, mask=img)
+            else:
+                # Palette and LA images are expanded one strip at a time rather than
+                # through a full-size RGBA copy.
+                rows = max(1, self.STRIP_BYTES // (w * 4))
+                for y0 in range(0, h, rows):
+                    box = (0, y0, w, min(h, y0 + rows))
+                    strip = img.crop(box).convert("RGBA")
+                    target.paste(strip, box, mask=strip)
+
+        flat = Image.frombuffer("RGBX", (w, h), pixels, "raw", "RGBX", 0, 1)
+        flat.info = img.info
+        return flat
+
+    def process(self, img, flatten_alpha):
+        icc = img.info.get("icc_profile")
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+
+        decoded, pixels = None, None
+        if flatten_alpha and img.mode == "RGBA" and isinstance(img, ImageFile.ImageFile) and img.tile:
+            decoded, pixels = img, self._decode_into_buffer(img)
+
+        # Palette images with alpha going to JPG stay paletted; _flatten expands them
+        # one strip at a time instead of through a full-size RGBA copy.
+        if img.mode in ("P", "PA") and (icc or (flatten_alpha and not has_alpha)):
+            img = img.convert("RGBA" if has_alpha else "RGB")
+
+        if icc and img.mode in ("RGB", "RGBA", "CMYK"):
+            out_mode = "RGBA" if img.mode == "RGBA" else "RGB"
+            transform = self._get_transform(icc, img.mode, out_mode)
+            if transform is not None:
+                # Memory-mapped images are read-only and applyTransform does not check
+                # before writing, so those always take the copying path.
+                if img.mode == out_mode and not img.readonly:
+                    ImageCms.applyTransform(img, transform, inPlace=True)
+                else:
+                    img = ImageCms.applyTransform(img, transform)
+                img.info.pop("icc_profile", None)
+
+        if flatten_alpha and has_alpha and img.mode in ("RGBA", "LA", "PA", "P"):
+            img = self._flatten(img, pixels if img is decoded else None)
+
+        if img.mode == "CMYK":
+            img = img.convert("RGB")
+        return img
+
+
+MAPPABLE_SUFFIXES = {".tif", ".tiff"}
+# Raw layouts Pillow can use as its own pixel buffer (Image._MAPMODES). 24-bit RGB is
+# not among them because Pillow stores RGB with 4 bytes per pixel, so it always needs a copy.
+RAW_BYTES_PER_PIXEL = {"L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2, "RGBA": 4, "RGBX": 4, "CMYK": 4}
+
+
+def _raw_layout(probe):
+    """Return (offset, rawmode, stride, orientation) if the pixels are one mappable, contiguous block."""
+    tiles = probe.tile
+    # Pillow's own loader already maps a single raw tile; only multi-strip files need this.
+    if len(tiles) < 2 or any(tile[0] != "raw" for tile in tiles):
+        return None
+    _, extents, offset, args = tiles[0]
+    if isinstance(args, str):
+        args = (args, 0, 1)
+    rawmode, stride, orientation = args[:3]
+    if rawmode != probe.mode or rawmode not in RAW_BYTES_PER_PIXEL:
+        return None
+    width, height = probe.size
+    stride = stride or width * RAW_BYTES_PER_PIXEL[rawmode]
+    if orientation != 1:
+        return None
+
+    # Strips must span the full width and follow each other directly in the file.
+    for _, (x0, y0, x1, y1), tile_offset, tile_args in tiles:
+        if isinstance(tile_args, str):
+            tile_args = (tile_args, 0, 1)
+        if (x0, x1) != (0, width) or tile_args[0] != rawmode or tile_offset != offset + y0 * stride:
+            return None
+    return offset, rawmode, stride, orientation
+
+
+@contextlib.contextmanager
+def open_image(source):
+    """Open an image, using a memory map of the file as the pixel buffer when possible.
+
+    Pillow already maps single-strip uncompressed files itself but copies multi-strip
+    TIFFs strip by strip. When such a TIFF is in a mode Pillow can address directly
+    (L, P, RGBA, CMYK, 16-bit grey) and its strips are contiguous, it is read straight
+    from the page cache without a copy. Everything else goes through Image.open as before.
+    """
+    if not (isinstance(source, Path) and source.suffix.lower() in MAPPABLE_SUFFIXES):
+        with Image.open(source) as img:
+            yield img
+        return
+
+    with Image.open(source) as probe:
+        layout = _raw_layout(probe)
+        if layout is None or layout[0] + layout[2] * probe.size[1] > source.stat().st_size:
+            yield probe
+            return
+        mode, size, info = probe.mode, probe.size, probe.info.copy()
+        palette = probe.getpalette() if probe.mode == "P" else None
+
+    offset, rawmode, stride, orientation = layout
+    with open(source, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)[offset:offset + stride * size[1]]
+    img = Image.frombuffer(mode, size, view, "raw", rawmode, stride, orientation)
+    img.info = info
+    if palette:
+        img.putpalette(palette)
+    try:
+        yield img
+    finally:
+        img.close()
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            # A derived image still references the mapping; it is unmapped once that is freed.
+            pass
+
+
+ARCHIVE_INPUT_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ARCHIVE_OUTPUT_SUFFIXES = (".zip", ".tar")
+
+
+def is_archive(path, suffixes=ARCHIVE_INPUT_SUFFIXES):
+    return str(path).lower().endswith(suffixes)
+
+
+class ArchiveReader:
+    """Streams image members out of a ZIP or TAR archive without extracting it.
+
+    Only one member is held in memory at a time, so memory use is bounded by the
+    largest image rather than by the size of the archive.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._size = self.path.stat().st_size
+        if zipfile.is_zipfile(self.path):
+            self._file = None
+            self._zip = zipfile.ZipFile(self.path)
+            self._tar = None
+        else:
+            self._file = open(self.path, "rb")
+            self._zip = None
+            self._tar = tarfile.open(fileobj=self._file, mode="r:*")
+        # A compressed TAR only seeks forward cheaply; going back restarts decompression
+        # from the top. Listing it already decompresses everything, so its members are
+        # listed and read together in one pass (see stream()).
+        self.sequential = self._tar is not None and self._tar.fileobj is not self._file
+
+    @staticmethod
+    def _relative_path(name, extensions, recursive):
+        relative_path = PurePosixPath(name)
+        if relative_path.is_absolute() or ".." in relative_path.parts:
+            return None
+        if not recursive and len(relative_path.parts) > 1:
+            return None
+        if relative_path.suffix.lower() not in extensions:
+            return None
+        return relative_path
+
+    def members(self, extensions, recursive):
+        """Return (relative_path, size, member) for matching images, in archive order."""
+        if self._zip:
+            entries = [(info.filename, info.file_size, info) for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            entries = [(info.name, info.size, info) for info in self._tar.getmembers() if info.isfile()]
+
+        result = []
+        for name, size, member in entries:
+            relative_path = self._relative_path(name, extensions, recursive)
+            if relative_path:
+                result.append((relative_path, size, member))
+        return result
+
+    def stream(self, extensions, recursive):
+        """Yield (relative_path, size, data) for matching images in a single pass over a TAR.
+
+        `data` holds the member's bytes, or the exception raised while reading them.
+        """
+        for info in self._tar:
+            relative_path = self._relative_path(info.name, extensions, recursive)
+            if not relative_path or not info.isfile():
+                continue
+            try:
+                data = io.BytesIO(self._tar.extractfile(info).read())
+            except Exception as e:
+                data = e
+            yield relative_path, info.size, data
+
+    def progress(self):
+        """Fraction of the archive file read so far; a closed archive counts as read."""
+        if not self._file or not self._size:
+            return 0.0
+        return 1.0 if self._file.closed else self._file.tell() / self._size
+
+    def read(self, member):
+        with self._lock:
+            if self._zip:
+                return io.BytesIO(self._zip.read(member))
+            return io.BytesIO(self._tar.extractfile(member).read())
+
+    def close(self):
+        (self._zip or self._tar).close()
+        if self._file:
+            self._file.close()
+
+
+class ArchiveWriter:
+    """Appends converted images to a ZIP or uncompressed TAR archive."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        if self.path.suffix.lower() == ".zip":
+            self._zip = zipfile.ZipFile(self.path, "a", zipfile.ZIP_STORED)
+            self._tar = None
+            self._names = set(self._zip.namelist())
+        else:
+            self._zip = None
+            self._tar = tarfile.open(self.path, "a")
+            self._names = set(self._tar.getnames())
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._names
+
+    def write(self, name, buffer):
+        with self._lock:
+            if self._zip:
+                # writestr knows the size up front, so members over 2 GiB get ZIP64 headers.
+                self._zip.writestr(name, buffer.getbuffer())
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = buffer.getbuffer().nbytes
+                info.mtime = int(time.time())
+                buffer.seek(0)
+                self._tar.addfile(info, buffer)
+            self._names.add(name)
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+
+class RunMetrics:
+    """Thread-safe counters for one conversion run.
+
+    Workers only bump counters under a short lock; the GUI samples a snapshot at a
+    fixed cadence, and each sample is kept so the run can be exported afterwards.
+    When the totals are not known up front, `progress` returns the fraction of the
+    input read so far and the ETA is extrapolated from it.
+    """
+
+    SERIES_FIELDS = (
+        "elapsed_s", "files_converted", "files_skipped", "files_total", "files_per_s", "mb_in_per_s",
+        "mb_out_per_s", "compression_ratio", "eta_s", "retries", "errors", "active_workers",
+    )
+
+    def __init__(self, total_files, total_bytes, progress=None):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.progress = progress
+        self.series = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._active = {}
+        self._files_converted = 0
+        self._files_skipped = 0
+        self._bytes_done = 0
+        self._bytes_skipped = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._retries = 0
+        self._errors = 0
+
+    def begin(self, worker, filename):
+        with self._lock:
+            self._active[worker] = (filename, time.monotonic())
+
+    def end(self, worker, status, size, new_size):
+        with self._lock:
+            self._active.pop(worker, None)
+            self._bytes_done += size
+            if status in ("exists", "skipped"):
+                # Skips finish almost instantly; counting them as work would inflate the rates.
+                self._files_skipped += 1
+                self._bytes_skipped += size
+            elif status == "done":
+                self._files_converted += 1
+                self._bytes_in += size
+                self._bytes_out += new_size
+            elif status == "error":
+                self._errors += 1
+
+    def add_retry(self):
+        with self._lock:
+            self._retries += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            elapsed = max(now - self._start, 1e-6)
+            mb_in_rate = self._bytes_in / elapsed / (1024 * 1024)
+            if self.total_bytes is None:
+                fraction = self.progress()
+                eta = round(elapsed * (1 - fraction) / fraction) if fraction else None
+            else:
+                done_rate = (self._bytes_done - self._bytes_skipped) / elapsed
+                remaining = self.total_bytes - self._bytes_done
+                eta = round(remaining / done_rate) if done_rate else None
+            return {
+                "elapsed_s": round(elapsed, 1),
+                "files_converted": self._files_converted,
+                "files_skipped": self._files_skipped,
+                "files_total": self.total_files,
+                "files_per_s": round(self._files_converted / elapsed, 3),
+                "mb_in_per_s": round(mb_in_rate, 3),
+                "mb_out_per_s": round(self._bytes_out / elapsed / (1024 * 1024), 3),
+                "compression_ratio": round(self._bytes_out / self._bytes_in, 3) if self._bytes_in else None,
+                "eta_s": eta,
+                "retries": self._retries,
+                "errors": self._errors,
+                "active_workers": len(self._active),
+                "workers": {name: (filename, now - started) for name, (filename, started) in self._active.items()},
+            }
+
+    def sample(self):
+        snapshot = self.snapshot()
+        self.series.append({field: snapshot[field] for field in self.SERIES_FIELDS})
+        return snapshot
+
+    def export(self, path):
+        path = Path(path)
+        if path.suffix.lower() == ".json":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.series, f, indent=2)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=self.SERIES_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.series)
+
+
+# Rough decode+encode cost per input byte; compressed formats pack many more pixels per byte.
+COST_PER_BYTE = {
+    ".jpg": 10.0, ".jpeg": 10.0, ".webp": 10.0, ".heic": 15.0,
+    ".png": 2.0, ".gif": 3.0, ".bmp": 0.35, ".tif": 0.5, ".tiff": 0.5,
+}
+
+
+def estimate_cost(relative_path, size):
+    return size * COST_PER_BYTE.get(relative_path.suffix.lower(), 1.0)
+
+
+def cpu_load():
+    """System-wide CPU load as a 0..1 fraction, or None when it can't be measured."""
+    if psutil:
+        return psutil.cpu_percent(interval=None) / 100
+    if hasattr(os, "getloadavg"):
+        return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+    return None
+
+
+def free_memory():
+    """Available system memory in bytes, or None when it can't be measured."""
+    if psutil:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class AdaptiveScheduler:
+    """Runs conversion tasks on a pool of threads whose active size follows the host's load.
+
+    Every `interval` seconds the controller looks at throughput, CPU load and free
+    memory and moves the number of active workers by one: down when the host is busy
+    or short on memory, or when the last increase made throughput worse; up while
+    there is headroom. Tasks are expected to be pre-sorted by estimated cost, so
+    throughput is measured in completed `cost(task)` per second rather than in tasks;
+    without `cost` every task counts as 1. `tasks` may also be an iterator, e.g. a
+    generator reading an archive; it is advanced one task at a time as workers free up.
+    """
+
+    # Linux applies niceness and affinity to the calling thread; elsewhere they are
+    # process-wide and would stack once per worker, so they are applied once per process.
+    PER_THREAD_PRIORITY = sys.platform.startswith("linux")
+    _process_priority_applied = False
+
+    def __init__(self, max_workers=None, min_workers=1, nice=0, cpu_affinity=None,
+                 cpu_target=0.85, min_free_mb=512, interval=2.0):
+        if cpu_affinity:
+            max_workers = min(max_workers or len(cpu_affinity), len(cpu_affinity))
+        self.max_workers = max(min_workers, max_workers or os.cpu_count() or 1)
+        self.min_workers = min_workers
+        self.nice = nice
+        self.cpu_affinity = cpu_affinity
+        self.cpu_target = cpu_target
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self.interval = interval
+        self.limit = max(min_workers, self.max_workers // 2)
+        self._condition = threading.Condition()
+        self._dispatch = threading.Lock()
+        self._exhausted = False
+        self._paused = False
+        self._completed_cost = 0.0
+        self._hold = 0
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def pause(self):
+        with self._condition:
+            self._paused = True
+
+    def resume(self):
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def _apply_priority(self):
+        if self.nice:
+            if hasattr(os, "nice"):
+                os.nice(self.nice)
+            elif psutil:
+                psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+        if self.cpu_affinity:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, self.cpu_affinity)
+            elif psutil:
+                psutil.Process().cpu_affinity(list(self.cpu_affinity))
+
+    def _worker(self, slot, take, work, should_stop, cost):
+        if self.PER_THREAD_PRIORITY:
+            try:
+                self._apply_priority()
+            except (OSError, AttributeError):
+                pass
+        while True:
+            with self._condition:
+                while not self._exhausted and (self._paused or slot >= self.limit) and not should_stop():
+                    self._condition.wait(0.2)
+                if should_stop() or self._exhausted:
+                    return
+            with self._dispatch:
+                try:
+                    task = take()
+                except (IndexError, StopIteration):
+                    # Wake parked workers so they exit instead of waiting for a slot.
+                    with self._condition:
+                        self._exhausted = True
+                        self._condition.notify_all()
+                    return
+            weight = cost(task) if cost else 1
+            try:
+                work(task)
+            finally:
+                with self._condition:
+                    self._completed_cost += weight
+
+    def _adjust(self, throughput, last_throughput, last_step):
+        load = cpu_load()
+        free = free_memory()
+        if free is not None and free < self.min_free_bytes and self.limit > self.min_workers:
+            return -1, f"low memory, {free / (1024 * 1024):.0f} MB free"
+        if load is not None and load > self.cpu_target and self.limit > self.min_workers:
+            return -1, f"CPU busy, {load:.0%}"
+        if last_step > 0 and throughput < last_throughput * 0.9 and self.limit > self.min_workers:
+            # Adding a worker made things slower; hold the lower level for a while.
+            self._hold = 5
+            return -1, f"throughput fell by {1 - throughput / last_throughput:.0%}"
+        if self._hold:
+            self._hold -= 1
+            return 0, ""
+        if self.limit < self.max_workers and (load is None or load < self.cpu_target - 0.1):
+            return 1, "headroom" if load is None else f"headroom, CPU {load:.0%}"
+        return 0, ""
+
+    def run(self, tasks, work, should_stop, on_adjust=None, cost=None):
+        take = tasks.__next__ if iter(tasks) is tasks else collections.deque(tasks).popleft
+        self._exhausted = False
+        if not self.PER_THREAD_PRIORITY and not AdaptiveScheduler._process_priority_applied:
+            AdaptiveScheduler._process_priority_applied = True
+            try:
+                self._apply_priority()
+            except (OSError, AttributeError):
+                pass
+        workers = [
+            threading.Thread(
+                target=self._worker, args=(slot, take, work, should_stop, cost), name=f"worker-{slot + 1}", daemon=True
+            )
+            for slot in range(self.max_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        cpu_load()  # prime psutil's sampling window
+        last_completed, last_time = 0.0, time.monotonic()
+        last_throughput, last_step = 0.0, 0
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(0.1)
+            now = time.monotonic()
+            if now - last_time < self.interval:
+                continue
+            if self._paused:
+                last_completed, last_time = self._completed_cost, now
+                continue
+            throughput = (self._completed_cost - last_completed) / (now - last_time)
+            step, reason = self._adjust(throughput, last_throughput, last_step)
+            if step:
+                with self._condition:
+                    self.limit += step
+                    self._condition.notify_all()
+                if on_adjust:
+                    on_adjust(self.limit, reason)
+            last_completed, last_time = self._completed_cost, now
+            last_throughput, last_step = throughput, step
+
 register_heif_opener()
 class ImageConverterApp:
     """A GUI application for converting images between formats with advanced features."""
 
-    def __init__(self, root):
+    def __init__(self, root, max_workers=None, nice=0, cpu_affinity=None):
         self.root = root
         self.root.title("Image Converter")
         self.root.geometry("600x575")  # 25% smaller: 800→600, 880→640 (با بهینه‌سازی layout)
@@ -97,6 +772,12 @@ class ImageConverterApp:
 
         self.is_converting = False
         self.stop_requested = False
+        self.max_workers = max_workers
+        self.nice = nice
+        self.cpu_affinity = cpu_affinity
+        self.scheduler = None
+        self.metrics = None
+        self.metrics_job = None
         self.cache = set()
         self.cache_lock = threading.Lock()
         self.icons = self.load_icons()
@@ -209,6 +890,18 @@ class ImageConverterApp:
             corner_radius=6,
         ).pack(side="right")
 
+        ctk.CTkButton(
+            input_frame,
+            text="Archive",
+            command=self.select_input_archive,
+            width=75,
+            height=20,
+            font=("Times New Roman", 12, "bold"),
+            fg_color=self.colors["bg_light"],
+            hover_color="#475569",
+            corner_radius=6,
+        ).pack(side="right", padx=(0, 8))
+
         # Output Folder
         ctk.CTkLabel(
             main_frame,
@@ -246,6 +939,18 @@ class ImageConverterApp:
             corner_radius=6,
         ).pack(side="right")
 
+        ctk.CTkButton(
+            output_frame,
+            text="Archive",
+            command=self.select_output_archive,
+            width=75,
+            height=20,
+            font=("Times New Roman", 12, "bold"),
+            fg_color=self.colors["bg_light"],
+            hover_color="#475569",
+            corner_radius=6,
+        ).pack(side="right", padx=(0, 8))
+
         # ========== FORMAT & QUALITY در یک خط (بهینه‌سازی فضا) ==========
         format_quality_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
         format_quality_frame.pack(fill="x", pady=(0, 12))  # فاصله بعد از این بلوک
@@ -278,7 +983,7 @@ class ImageConverterApp:
 
         self.output_format_combo = SelectOnlyComboBox(
             format_quality_frame,
-            values=["JPG", "PNG", "WEBP"],
+            values=["AUTO", "JPG", "PNG", "WEBP"],
             width=90,  # 25% smaller: 75→56
             font=("Times New Roman", 12, "bold"),
             dropdown_font=("Times New Roman", 12, "bold"),
@@ -384,6 +1089,26 @@ class ImageConverterApp:
         )
         self.progress_label.pack(pady=(0, 6))  # فاصله کم تا log
 
+        # ========== PERFORMANCE ==========
+        self.metrics_label = ctk.CTkLabel(
+            main_frame,
+            text="Files/s: -   In: - MB/s   Out: - MB/s   Ratio: -   ETA: -   Retries: 0",
+            font=("Consolas", 12),
+            text_color=self.colors["text_secondary"],
+            anchor="w",
+        )
+        self.metrics_label.pack(fill="x")
+
+        self.workers_label = ctk.CTkLabel(
+            main_frame,
+            text="Workers: idle",
+            font=("Consolas", 12),
+            text_color=self.colors["text_secondary"],
+            anchor="w",
+            justify="left",
+        )
+        self.workers_label.pack(fill="x", pady=(0, 6))
+
         # ========== STATUS / LOG ==========
         ctk.CTkLabel(
             main_frame,
@@ -441,6 +1166,34 @@ class ImageConverterApp:
         )
         self.stop_btn.pack(side="left", padx=(0, 8), pady=(0, 15))
 
+        self.pause_btn = ctk.CTkButton(
+            button_frame,
+            text="Pause",
+            command=self.toggle_pause,
+            width=75,
+            height=22,
+            font=("Times New Roman", 18, "bold"),
+            fg_color=self.colors["accent_warning"],
+            hover_color="#D97706",
+            corner_radius=8,
+            state="disabled",
+        )
+        self.pause_btn.pack(side="left", padx=(0, 8), pady=(0, 15))
+
+        self.export_btn = ctk.CTkButton(
+            button_frame,
+            text="Metrics",
+            command=self.export_metrics,
+            width=75,
+            height=22,
+            font=("Times New Roman", 18, "bold"),
+            fg_color=self.colors["bg_light"],
+            hover_color="#475569",
+            corner_radius=8,
+            state="disabled",
+        )
+        self.export_btn.pack(side="left", padx=(0, 8), pady=(0, 15))
+
         ctk.CTkButton(
             button_frame,
             text="Exit",
@@ -470,6 +1223,26 @@ class ImageConverterApp:
             self.output_entry.delete(0, "end")
             self.output_entry.insert(0, folder)
 
+    def select_input_archive(self):
+        archive = filedialog.askopenfilename(
+            title="Select Input Archive",
+            filetypes=[("Archives", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tbz2 *.tar.xz *.txz"), ("All files", "*.*")],
+        )
+        if archive:
+            self.input_entry.delete(0, "end")
+            self.input_entry.insert(0, archive)
+
+    def select_output_archive(self):
+        archive = filedialog.asksaveasfilename(
+            title="Select Output Archive",
+            defaultextension=".zip",
+            filetypes=[("ZIP archive", "*.zip"), ("TAR archive", "*.tar")],
+            confirmoverwrite=False,
+        )
+        if archive:
+            self.output_entry.delete(0, "end")
+            self.output_entry.insert(0, archive)
+
     def log(self, message):
         self.root.after(0, lambda: self._log(message))
 
@@ -481,6 +1254,48 @@ class ImageConverterApp:
         self.root.after(0, lambda: self.progress_bar.set(value))
         self.root.after(0, lambda: self.progress_label.configure(text=f"{value * 100:.2f}%"))
 
+    def refresh_metrics(self):
+        """Sample the run's metrics once a second; workers never wait on the GUI."""
+        if self.metrics:
+            snapshot = self.metrics.sample()
+            ratio = snapshot["compression_ratio"]
+            eta = snapshot["eta_s"]
+            self.metrics_label.configure(
+                text=(
+                    f"Files/s: {snapshot['files_per_s']:.2f}   "
+                    f"In: {snapshot['mb_in_per_s']:.2f} MB/s   "
+                    f"Out: {snapshot['mb_out_per_s']:.2f} MB/s   "
+                    f"Ratio: {f'{ratio:.2f}' if ratio is not None else '-'}   "
+                    f"ETA: {f'{eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}' if eta is not None else '-'}   "
+                    f"Skipped: {snapshot['files_skipped']}   "
+                    f"Retries: {snapshot['retries']}"
+                )
+            )
+            workers = snapshot["workers"]
+            if workers:
+                activity = "   ".join(
+                    f"{name}: {filename} ({seconds:.0f}s)" for name, (filename, seconds) in sorted(workers.items())
+                )
+            else:
+                activity = "idle"
+            self.workers_label.configure(text=f"Workers: {activity}")
+        if self.is_converting:
+            self.metrics_job = self.root.after(1000, self.refresh_metrics)
+        elif self.metrics:
+            self.export_btn.configure(state="normal")
+
+    def export_metrics(self):
+        if not self.metrics:
+            return
+        path = filedialog.asksaveasfilename(
+            title="Export Metrics",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json")],
+        )
+        if path:
+            self.metrics.export(path)
+            self.log(f"Metrics exported to {path}")
+
     def start_conversion(self):
         input_path = self.input_entry.get().strip()
         output_path = self.output_entry.get().strip()
@@ -495,6 +1310,9 @@ class ImageConverterApp:
         self.stop_requested = False
         self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
+        self.pause_btn.configure(state="normal", text="Pause")
+        self.export_btn.configure(state="disabled")
+        self.metrics = None
         self.log_text.delete("1.0", "end")
         self.update_progress(0)
 
@@ -536,6 +1354,10 @@ class ImageConverterApp:
             if not messagebox.askyesno("Confirm", "Delete original files after successful converting?"):
                 return
 
+        # Created before the files are listed, so Pause works while a large archive is still being read.
+        self.scheduler = AdaptiveScheduler(
+            max_workers=self.max_workers, nice=self.nice, cpu_affinity=self.cpu_affinity
+        )
         thread = threading.Thread(
             target=self.convert_images,
             args=(
@@ -552,11 +1374,28 @@ class ImageConverterApp:
             daemon=True,
         )
         thread.start()
+        if self.metrics_job:
+            self.root.after_cancel(self.metrics_job)
+        self.metrics_job = self.root.after(1000, self.refresh_metrics)
 
     def stop_conversion(self):
         self.stop_requested = True
+        if self.scheduler:
+            self.scheduler.resume()
         self.log("Stopping converting...")
 
+    def toggle_pause(self):
+        if not self.scheduler:
+            return
+        if self.scheduler.paused:
+            self.scheduler.resume()
+            self.pause_btn.configure(text="Pause")
+            self.log("Converting resumed.")
+        else:
+            self.scheduler.pause()
+            self.pause_btn.configure(text="Resume")
+            self.log("Converting paused; images already in progress will finish.")
+
     def convert_images(
             self,
             input_folder,
@@ -569,9 +1408,9 @@ class ImageConverterApp:
             output_format,
             behavior,
     ):
+        reader = None
+        writer = None
         try:
-            Path(output_folder).mkdir(parents=True, exist_ok=True)
-
             all_extensions = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".gif", ".webp", ".heic"}
             if input_selection.upper() == "ALL":
                 extensions = all_extensions
@@ -579,129 +1418,249 @@ class ImageConverterApp:
                 extensions = {f".{input_selection.lower()}"}
 
             input_path = Path(input_folder)
-            pattern = "**/*" if recursive else "*"
-            image_files = [
-                p
-                for p in input_path.glob(pattern)
-                if p.suffix.lower() in extensions and p.is_file()
-            ]
-
-            if not image_files:
+            if input_path.is_file() and is_archive(input_path):
+                reader = ArchiveReader(input_path)
+                # Compressed TARs are listed while they are converted, see below.
+                image_files = None if reader.sequential else reader.members(extensions, recursive)
+                if delete_originals:
+                    self.log("Note: originals inside an archive are never deleted.")
+                    delete_originals = False
+            else:
+                pattern = "**/*" if recursive else "*"
+                image_files = [
+                    (p.relative_to(input_path), p.stat().st_size, p)
+                    for p in input_path.glob(pattern)
+                    if p.suffix.lower() in extensions and p.is_file()
+                ]
+
+            if is_archive(output_folder, ARCHIVE_OUTPUT_SUFFIXES):
+                writer = ArchiveWriter(output_folder)
+            else:
+                Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+            if image_files is not None and not image_files:
                 self.log("No images found with the selected input format!")
                 self.conversion_finished()
                 return
 
-            total = len(image_files)
-            self.log(f"Found {total} image(s). Starting converting...\n")
+            if image_files is None:
+                total = None
+                self.log("Reading images from the archive in a single pass. Starting converting...\n")
+            else:
+                total = len(image_files)
+                self.log(f"Found {total} image(s). Starting converting...\n")
 
             success_count = 0
             total_original_size = 0
             total_new_size = 0
+            auto_counts = {}
+            completed = 0
+            stats_lock = threading.Lock()
+            color_stage = ColorStage()
+
+            if image_files is None:
+                # Members are read in archive order as workers free up; a failed read travels
+                # with its task, so _convert_one reports it like any other error.
+                def stream_tasks():
+                    idx = 0
+                    try:
+                        for idx, entry in enumerate(reader.stream(extensions, recursive), 1):
+                            yield (idx, *entry)
+                    except Exception as e:
+                        self.log(f"\nError: archive unreadable after {idx} image(s): {e}")
+
+                tasks = stream_tasks()
+                self.metrics = RunMetrics(None, None, progress=reader.progress)
+            else:
+                tasks = [(idx, *entry) for idx, entry in enumerate(image_files, 1)]
+                tasks.sort(key=lambda task: estimate_cost(task[1], task[2]))
+                self.metrics = RunMetrics(total, sum(task[2] for task in tasks))
+
+            def run_task(task):
+                nonlocal success_count, total_original_size, total_new_size, completed
+                worker = threading.current_thread().name
+                self.metrics.begin(worker, task[1].name)
+                status, new_size, choice = self._convert_one(
+                    task, total or "?", output_folder, quality, lossless, delete_originals,
+                    output_format, behavior, reader, writer, color_stage,
+                )
+                self.metrics.end(worker, status, task[2], new_size)
+                with stats_lock:
+                    if status != "exists":
+                        total_original_size += task[2]
+                    if status == "done":
+                        success_count += 1
+                        total_new_size += new_size
+                    if choice:
+                        auto_counts[choice] = auto_counts.get(choice, 0) + 1
+                    completed += 1
+                    self.update_progress(completed / total if total else reader.progress())
+
+            self.scheduler.run(
+                tasks,
+                run_task,
+                should_stop=lambda: self.stop_requested,
+                on_adjust=lambda workers, reason: self.log(f"Scheduler: {workers} worker(s) ({reason})"),
+                cost=lambda task: estimate_cost(task[1], task[2]),
+            )
+            if self.stop_requested:
+                self.log("\nConverting stopped by user.")
+            elif not completed:
+                self.log("No images found with the selected input format!")
+                return
 
-            qualities_to_try = [quality, 85, 75] if output_format == "webp" and not lossless else [quality]
+            if not self.stop_requested:
+                self._show_final_report(success_count, total_original_size, total_new_size, auto_counts)
 
-            for idx, file_path in enumerate(image_files, 1):
-                if self.stop_requested:
-                    self.log("\nConverting stopped by user.")
-                    break
+        except Exception as e:
+            self.log(f"\nError: {e}")
+        finally:
+            for archive in (reader, writer):
+                if archive:
+                    archive.close()
+            with self.cache_lock:
+                self.cache.clear()
+            self.conversion_finished()
 
-                filename = file_path.name
-                relative_path = file_path.relative_to(input_path)
-                output_file = Path(output_folder) / relative_path.with_suffix(f".{output_format}")
+    def _convert_one(
+            self,
+            task,
+            total,
+            output_folder,
+            quality,
+            lossless,
+            delete_originals,
+            output_format,
+            behavior,
+            reader,
+            writer,
+            color_stage,
+    ):
+        """Convert a single image; returns (status, new_size, auto_choice)."""
+        idx, relative_path, original_size, file_path = task
+        filename = relative_path.name
+        choice = None
+        if writer:
+            output_file = PurePosixPath(relative_path.as_posix()).with_suffix(f".{output_format}")
+        else:
+            output_file = Path(output_folder) / relative_path.with_suffix(f".{output_format}")
+        if output_format == "auto":
+            candidates = [output_file.with_suffix(f".{fmt}") for fmt in ("webp", "jpg", "png")]
+        else:
+            candidates = [output_file]
 
-                output_file.parent.mkdir(parents=True, exist_ok=True)
+        if not writer:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
 
-                with self.cache_lock:
-                    if str(output_file) in self.cache or output_file.exists():
-                        self.log(f"[{idx}/{total}] Skipped: {filename} (already converted)")
-                        self.update_progress(idx / total)
-                        continue
+        def is_source(candidate):
+            return isinstance(file_path, Path) and not writer and candidate.exists() and candidate.samefile(file_path)
 
-                try:
-                    original_size = file_path.stat().st_size
-                    total_original_size += original_size
-
-                    with Image.open(file_path) as img:
-                        original_w, original_h = img.size
-                        output_format_local = output_format
-                        output_file_local = output_file
-
-                        if output_format == "webp" and max(original_w, original_h) > 16383:
-                            self.log(
-                                f"[{idx}/{total}] Warning: {filename} is oversized "
-                                f"({original_w}x{original_h}) for WebP."
-                            )
-                            if behavior == "skip":
-                                self.log(f"[{idx}/{total}] Skipped: {filename} due to size limit.")
-                                self.update_progress(idx / total)
-                                continue
-                            elif behavior == "convert_to_jpg":
-                                output_format_local = "jpg"
-                                output_file_local = output_file.with_suffix(".jpg")
-                                self.log(
-                                    f"[{idx}/{total}] Converting {filename} to JPG instead due to size limit."
-                                )
-                            elif behavior == "resize":
-                                max_side = 16383.0
-                                scale = min(max_side / original_w, max_side / original_h)
-                                new_w = int(original_w * scale)
-                                new_h = int(original_h * scale)
-                                img = img.resize((new_w, new_h), Image.LANCZOS)
-                                self.log(
-                                    f"[{idx}/{total}] Resized {filename} from "
-                                    f"{original_w}x{original_h} to {new_w}x{new_h} for WebP compatibility."
-                                )
-                            else:
-                                raise ValueError("Invalid oversized behavior")
-
-                        if img.mode in ("RGBA", "LA", "P") and output_format_local == "jpg":
-                            bg = Image.new("RGB", img.size, (255, 255, 255))
-                            if "A" in img.getbands():
-                                bg.paste(img, mask=img.getchannel("A"))
-                            else:
-                                bg.paste(img)
-                            img = bg
-
-                        if output_format_local == "webp":
-                            qualities_to_try_local = (
-                                [quality, 85, 75] if not lossless else [100]
-                            )
-                        else:
-                            qualities_to_try_local = [quality]
-
-                        new_size = self._save_image(
-                            img,
-                            output_file_local,
-                            output_format_local,
-                            qualities_to_try_local,
-                            original_size,
-                            lossless if output_format_local == "webp" else False,
-                        )
-                        total_new_size += new_size
+        # The source itself is not a finished output, e.g. photo.jpg when AUTO may write
+        # photo.jpg/.png/.webp back into the input folder.
+        if output_format == "auto":
+            candidates = [c for c in candidates if not is_source(c)]
 
-                        if delete_originals:
-                            file_path.unlink()
+        # Claim the output names up front so that two workers never write the same file.
+        with self.cache_lock:
+            if any(str(c) in self.cache or (str(c) in writer if writer else c.exists()) for c in candidates):
+                self.log(f"[{idx}/{total}] Skipped: {filename} (already converted)")
+                return "exists", 0, None
+            self.cache.update(str(c) for c in candidates)
 
+        try:
+            if isinstance(file_path, Exception):
+                raise file_path
+            source = reader.read(file_path) if reader and not reader.sequential else file_path
+
+            with open_image(source) as img:
+                original_w, original_h = img.size
+                output_format_local = output_format
+                output_file_local = output_file
+                lossless_local = lossless
+
+                if output_format == "auto":
+                    # Decode first so the logged time covers classification only.
+                    img.load()
+                    started = time.perf_counter()
+                    output_format_local, auto_lossless, reason = classify_image(img)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    lossless_local = lossless or auto_lossless
+                    output_file_local = output_file.with_suffix(f".{output_format_local}")
+                    choice = output_format_local.upper()
+                    if output_format_local == "webp":
+                        choice += " lossless" if lossless_local else " lossy"
+                    self.log(f"[{idx}/{total}] Auto: {filename} → {choice} ({reason}; {elapsed_ms:.1f} ms)")
+                    if is_source(output_file_local):
                         with self.cache_lock:
-                            self.cache.add(str(output_file_local))
-
-                        self.log(f"[{idx}/{total}] Done: {filename} → {output_file_local.name}")
-                        success_count += 1
-
-                except Exception as e:
-                    self.log(f"[{idx}/{total}] Error: {filename} → {str(e)}")
+                            self.cache.difference_update(str(c) for c in candidates)
+                        self.log(f"[{idx}/{total}] Skipped: {filename} (already in the chosen format)")
+                        return "skipped", 0, choice
+
+                if output_format_local == "webp" and max(original_w, original_h) > WEBP_MAX_SIDE:
+                    self.log(
+                        f"[{idx}/{total}] Warning: {filename} is oversized "
+                        f"({original_w}x{original_h}) for WebP."
+                    )
+                    if behavior == "skip":
+                        with self.cache_lock:
+                            self.cache.difference_update(str(c) for c in candidates)
+                        self.log(f"[{idx}/{total}] Skipped: {filename} due to size limit.")
+                        return "skipped", 0, choice
+                    elif behavior == "convert_to_jpg":
+                        output_format_local = "jpg"
+                        output_file_local = output_file.with_suffix(".jpg")
+                        self.log(
+                            f"[{idx}/{total}] Converting {filename} to JPG instead due to size limit."
+                        )
+                    elif behavior == "resize":
+                        max_side = float(WEBP_MAX_SIDE)
+                        scale = min(max_side / original_w, max_side / original_h)
+                        new_w = int(original_w * scale)
+                        new_h = int(original_h * scale)
+                        img = img.resize((new_w, new_h), Image.LANCZOS)
+                        self.log(
+                            f"[{idx}/{total}] Resized {filename} from "
+                            f"{original_w}x{original_h} to {new_w}x{new_h} for WebP compatibility."
+                        )
+                    else:
+                        raise ValueError("Invalid oversized behavior")
+
+                img = color_stage.process(img, flatten_alpha=output_format_local == "jpg")
+
+                if output_format_local == "webp":
+                    qualities_to_try_local = (
+                        [quality, 85, 75] if not lossless_local else [100]
+                    )
+                else:
+                    qualities_to_try_local = [quality]
+
+                buffer = io.BytesIO() if writer else None
+                new_size = self._save_image(
+                    img,
+                    buffer if writer else output_file_local,
+                    output_format_local,
+                    qualities_to_try_local,
+                    original_size,
+                    lossless_local if output_format_local == "webp" else False,
+                )
+                if writer:
+                    writer.write(str(output_file_local), buffer)
+
+            # Deleting only after the image is closed also releases any memory map on the file.
+            if delete_originals:
+                file_path.unlink()
 
-                self.update_progress(idx / total)
+            with self.cache_lock:
+                self.cache.add(str(output_file_local))
 
-            if not self.stop_requested:
-                self._show_final_report(success_count, total_original_size, total_new_size)
+            self.log(f"[{idx}/{total}] Done: {filename} → {output_file_local.name}")
+            return "done", new_size, choice
 
         except Exception as e:
-            self.log(f"\nError: {e}")
-        finally:
             with self.cache_lock:
-                self.cache.clear()
-            self.conversion_finished()
+                self.cache.difference_update(str(c) for c in candidates)
+            self.log(f"[{idx}/{total}] Error: {filename} → {str(e)}")
+            return "error", 0, choice
 
     def _save_image(self, img, output_path, output_format, qualities, original_size, lossless):
         save_args = {}
@@ -710,21 +1669,34 @@ class ImageConverterApp:
             if lossless:
                 save_args["lossless"] = True
                 save_args["quality"] = 100
-                img.save(output_path, "WEBP", **save_args)
+                size = self._encode(img, output_path, "WEBP", **save_args)
             else:
-                for q in qualities:
+                for attempt, q in enumerate(qualities):
+                    if attempt and self.metrics:
+                        self.metrics.add_retry()
                     save_args["quality"] = q
-                    img.save(output_path, "WEBP", **save_args)
-                    if output_path.stat().st_size < original_size:
+                    size = self._encode(img, output_path, "WEBP", **save_args)
+                    if size < original_size:
                         break
         elif output_format == "jpg":
             save_args["quality"] = qualities[0]
-            img.save(output_path, "JPEG", **save_args)
+            size = self._encode(img, output_path, "JPEG", **save_args)
         elif output_format == "png":
-            img.save(output_path, "PNG")
-        return output_path.stat().st_size
-
-    def _show_final_report(self, success_count, orig_size, new_size):
+            size = self._encode(img, output_path, "PNG")
+        return size
+
+    @staticmethod
+    def _encode(img, target, fmt, **save_args):
+        """Save to a path or an in-memory buffer (for archive outputs) and return the encoded size."""
+        if isinstance(target, io.BytesIO):
+            target.seek(0)
+            target.truncate()
+            img.save(target, fmt, **save_args)
+            return target.tell()
+        img.save(target, fmt, **save_args)
+        return target.stat().st_size
+
+    def _show_final_report(self, success_count, orig_size, new_size, auto_counts=None):
         self.log("\n" + "=" * 60)
         self.log("Converting completed!")
         self.log("=" * 60 + "\n")
@@ -739,12 +1711,16 @@ class ImageConverterApp:
         self.log(f" • Original size: {orig_mb:.2f} MB")
         self.log(f" • New size: {new_mb:.2f} MB")
         self.log(f" • Saved: {saved_mb:.2f} MB ({percent:.1f}%)")
+        if auto_counts:
+            summary = ", ".join(f"{name}: {count}" for name, count in sorted(auto_counts.items()))
+            self.log(f" • Auto formats: {summary}")
         self.log("\n" + "=" * 60)
 
     def conversion_finished(self):
         self.is_converting = False
         self.root.after(0, lambda: self.start_btn.configure(state="normal"))
         self.root.after(0, lambda: self.stop_btn.configure(state="disabled"))
+        self.root.after(0, lambda: self.pause_btn.configure(state="disabled", text="Pause"))
 
 
 if __name__ == "__main__":
@@ -756,7 +1732,10 @@ if __name__ == "__main__":
     parser.add_argument("--lossless", action="store_true", help="Lossless mode for WebP")
     parser.add_argument("--delete-originals", action="store_true", help="Delete originals")
     parser.add_argument("--input-format", default="all", help="Input format: all, jpg, png, webp, heic, etc.")
-    parser.add_argument("--output-format", default="webp", help="Output format: jpg, png, webp")
+    parser.add_argument("--output-format", default="webp", help="Output format: auto, jpg, png, webp")
+    parser.add_argument("--max-workers", type=int, help="Upper bound for concurrent conversions (default: CPU count)")
+    parser.add_argument("--nice", type=int, default=0, help="Lower the priority of conversion threads by this amount")
+    parser.add_argument("--cpu-affinity", help="Comma-separated CPU ids conversion threads may run on, e.g. 0,1,2")
 
     args = parser.parse_args()
 
@@ -766,5 +1745,6 @@ if __name__ == "__main__":
     else:
         root = ctk.CTk()
         root.configure(fg_color="#0F172A")
-        app = ImageConverterApp(root)
+        cpu_affinity = {int(cpu) for cpu in args.cpu_affinity.split(",")} if args.cpu_affinity else None
+        app = ImageConverterApp(root, max_workers=args.max_workers, nice=args.nice, cpu_affinity=cpu_affinity)
         root.mainloop()
\ No newline at end of file